@@ -1,9 +1,20 @@
 import streamlit as st
-import duckdb
 import pandas as pd
-import requests
+import duckdb
 from datetime import datetime, timedelta
+import logging
+import math
 import os
+from contextlib import contextmanager
+from functools import partial
+
+from database import DatabaseManager
+from disk_cache import DiskCache
+from exports import EXCEL_MAX_ROWS, EXPORT_FORMATS, available_formats, export_pivot, export_raw, load_excel
+from instrumentation import Timings
+from result_cache import ResultCache
+from queries import (GRANULARITIES, VIEW_COLUMNS, Filters, filter_options, load_page, memory_usage,
+                     route_date_pivot, summary_metrics)
 
 # ==============================================================
 # 1️⃣  Page configuration
@@ -16,83 +27,272 @@ st.title("📊 Sales Data Dashboard")
 # ==============================================================
 db_filename = "dispatch.duckdb"
 url = "https://drive.google.com/uc?export=download&id=1tYt3Z5McuQYifmNImZyACPHW9C9ju7L4"
+# How often (seconds) to ask Google Drive whether the database changed
+refresh_interval = int(os.environ.get("DISPATCH_REFRESH_INTERVAL", 6 * 60 * 60))
+# Keep row-level data as Arrow tables from DuckDB to Streamlit (set to 0 for pandas)
+arrow_mode = os.environ.get("DISPATCH_ARROW", "1") == "1"
+# Bounds for the shared per-filter cache of metrics and pivots
+cache_entries = int(os.environ.get("DISPATCH_CACHE_ENTRIES", 64))
+cache_mb = int(os.environ.get("DISPATCH_CACHE_MB", 256))
+# Second cache level on disk, shared by every dashboard process on this host (empty = disabled)
+disk_cache_dir = os.environ.get("DISPATCH_DISK_CACHE_DIR", "dispatch_cache")
+disk_cache_mb = int(os.environ.get("DISPATCH_DISK_CACHE_MB", 1024))
+# Daily sales deltas (CSV / Parquet) dropped here are appended to the local database
+ingest_dir = os.environ.get("DISPATCH_INGEST_DIR", "incoming")
+# DuckDB resources for the shared read-only snapshot (unset = DuckDB defaults)
+duckdb_threads = int(os.environ.get("DISPATCH_DUCKDB_THREADS", 0)) or None
+duckdb_memory_limit = os.environ.get("DISPATCH_DUCKDB_MEMORY_LIMIT")
+# Per-stage timings are logged as JSON lines on the "dispatch.timing" logger (set to 0 to silence them)
+timing_log = os.environ.get("DISPATCH_TIMING_LOG", "1") == "1"
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logging.getLogger("dispatch.timing").setLevel(logging.INFO if timing_log else logging.WARNING)
+# Timings for this rerun; stages are shown in the sidebar Performance panel
+timings = Timings()
+
+def invalidate_days(first_date, last_date):
+    """Drop only the cached results whose date range touches newly ingested days."""
+    result_cache().invalidate(
+        lambda key: any(isinstance(part, Filters) and part.overlaps(first_date, last_date) for part in key)
+    )
+    load_filter_options.clear()
 
 @st.cache_resource
-def download_database():
-    """Download the database file from Google Drive if not already cached."""
-    if not os.path.exists(db_filename):
-        st.info("⬇️ Downloading database file from Google Drive...")
-        response = requests.get(url)
-        with open(db_filename, "wb") as f:
-            f.write(response.content)
+def database():
+    """Shared database manager; after the first download, refreshes and ingests happen in a background thread."""
+    manager = DatabaseManager(url, db_filename, refresh_interval, ingest_dir=ingest_dir, on_ingest=invalidate_days,
+                              threads=duckdb_threads, memory_limit=duckdb_memory_limit)
+    progress_bar = None
+
+    def show_progress(done, total):
+        nonlocal progress_bar
+        if progress_bar is None:
+            st.info("⬇️ Downloading database file from Google Drive...")
+            progress_bar = st.progress(0.0, text="Starting download...")
+        if total:
+            progress_bar.progress(min(done / total, 1.0), text=f"{done / 1e6:,.1f} / {total / 1e6:,.1f} MB")
+        else:
+            progress_bar.progress(0.0, text=f"{done / 1e6:,.1f} MB")
+
+    with timings.stage("open_database"):
+        manager.open(progress=show_progress)
+    if progress_bar is not None:
+        progress_bar.empty()
         st.success("✅ Database downloaded successfully.")
-    return duckdb.connect(db_filename)
+    manager.start()
+    return manager
+
+def download_database():
+    """Read-only cursor on the current database snapshot for this thread."""
+    return database().connection()
+
+def database_version():
+    """Version of the snapshot currently served, used to key cached data."""
+    return database().version
 
 # ==============================================================
 # 3️⃣  Load data
 # ==============================================================
 @st.cache_data
-def load_data():
-    conn = download_database()
-    query = """
-    SELECT 
-        s.Code,
-        s.Sales_Date,
-        s.Qty,
-        s.Route,
-        p.Description,
-        p.Cake,
-        p.Cr_Bo AS Crates_Box,
-        sup.Supervisor,
-        CASE 
-            WHEN p.Cake IS NOT NULL AND p.Cake <> 0 
-                THEN CAST(s.Qty AS DOUBLE) / CAST(p.Cake AS DOUBLE)
-            ELSE NULL
-        END AS Crt_Box
-    FROM sales AS s
-    LEFT JOIN Products AS p
-        ON TRIM(CAST(s.Code AS VARCHAR)) = TRIM(CAST(p.Code AS VARCHAR))
-    LEFT JOIN Supervisors AS sup
-        ON s.Route = sup.Route;
+def load_filter_options(db_version):
+    """Date bounds and Supervisor / Crates_Box choices for the sidebar."""
+    with timings.stage("filter_options"):
+        return filter_options(download_database())
+
+@st.cache_resource
+def excel_available():
+    """Install / load DuckDB's excel extension once, so Excel downloads never need the network."""
+    return load_excel(duckdb.connect())
+
+@st.cache_resource
+def result_cache():
+    """LRU cache of metrics and pivots shared by all sessions, keyed on the normalized filters.
+
+    Misses fall through to the on-disk cache, whose entries are tied to the
+    content of the served data (download hash plus ingested files), so
+    replicas and restarts reuse each other's results and ingested days never
+    serve stale files.
     """
-    complete_df = conn.execute(query).fetchdf()
-    df = complete_df[['Sales_Date', 'Route', 'Crates_Box', 'Crt_Box', 'Supervisor']]
-    df['Sales_Date'] = pd.to_datetime(df['Sales_Date'])
-    df['Crt_Box'] = df['Crt_Box'].round(0)  # Round to whole numbers
-    return df
+    disk = None
+    if disk_cache_dir:
+        disk = DiskCache(disk_cache_dir, max_bytes=disk_cache_mb * 1024 * 1024)
+    return ResultCache(max_entries=cache_entries, max_bytes=cache_mb * 1024 * 1024, disk=disk,
+                       namespace=lambda: database().data_id)
+
+def cached(key, compute):
+    """Look ``key`` up in the result cache, timing the lookup as a stage named after its kind."""
+    with timings.stage(key[0], cache="hit") as stage:
+        def timed_compute():
+            stage["cache"] = "miss"
+            return stage.count(compute())
+        value = result_cache().get_or_compute(key, timed_compute)
+        # Sizes were already measured on a miss; a hit only reports rows
+        return stage.count(value, size=False) if stage["cache"] == "hit" else value
+
+def load_metrics(db_version, filters):
+    """Summary metrics for the sidebar filters, answered from the daily rollup."""
+    return cached(("metrics", db_version, filters), lambda: summary_metrics(download_database(), filters))
+
+def load_pivot(db_version, filters, granularity, top_n):
+    """Route x Date pivot of Crt_Box, aggregated inside DuckDB."""
+    return cached(
+        ("pivot", db_version, filters, granularity, top_n),
+        lambda: route_date_pivot(download_database(), filters, granularity, top_n),
+    )
+
+def load_raw_page(db_version, filters, page, page_size, sort_by, descending):
+    """One page of raw rows, fetched from DuckDB with LIMIT/OFFSET."""
+    return cached(
+        ("raw_page", db_version, filters, page, page_size, sort_by, descending),
+        lambda: load_page(download_database(), filters, page, page_size, sort_by, descending, arrow=arrow_mode),
+    )
+
+def pivot_export(db_version, filters, granularity, top_n, fmt):
+    """Pivot export, built by DuckDB only when the download button is clicked and cached per filter state."""
+    return cached(
+        ("pivot_export", fmt, db_version, filters, granularity, top_n),
+        lambda: export_pivot(download_database(), filters, fmt, granularity, top_n),
+    )
+
+def raw_export(db_version, filters, columns, fmt):
+    """Raw-data export, built by DuckDB only when the download button is clicked and cached per filter state."""
+    return cached(
+        ("raw_export", fmt, db_version, filters, columns),
+        lambda: export_raw(download_database(), filters, fmt, columns),
+    )
 
 # ==============================================================
-# 4️⃣  Dashboard Logic
+# 4️⃣  Dashboard sections
+# ==============================================================
+# Each section below is a fragment: its own widgets rerun only that section,
+# and its inputs are passed in explicitly. Changing a sidebar filter still
+# reruns the whole script, since every section depends on the filters.
+
+@contextmanager
+def section_timings(name):
+    """Give a fragment that reruns on its own a fresh set of timings (the full rerun's are already logged)."""
+    global timings
+    if not timings.finished:
+        yield
+        return
+    timings = Timings(fragment=name)
+    yield
+    timings.finish()
+
+@st.fragment
+def export_section(label, export, file_stem, key, rows):
+    """Format picker and download button; ``export(fmt)`` is only called when someone downloads."""
+    formats = available_formats(rows, excel_available())
+    export_format = st.selectbox(f"{label} export format", formats, key=key)
+    if len(formats) < len(EXPORT_FORMATS) and excel_available():
+        st.caption(f"Excel is only offered up to {EXCEL_MAX_ROWS:,} rows; narrow the filters or use CSV / Parquet.")
+    extension, _, mime = EXPORT_FORMATS[export_format]
+    st.download_button(
+        label=f"📥 Download {label} as {export_format}",
+        data=partial(export, export_format),
+        file_name=f"{file_stem}.{extension}",
+        mime=mime,
+        on_click="ignore"
+    )
+
+@st.fragment
+def pivot_section(db_version, filters):
+    """Pivot table with its granularity / Top-N controls and export."""
+    with section_timings("pivot"):
+        # Wide ranges stay readable and cheap: bucket the columns and/or keep only the top routes
+        col1, col2 = st.columns(2)
+        with col1:
+            granularity = st.radio("Columns per", list(GRANULARITIES), horizontal=True, key="pivot_granularity")
+        with col2:
+            top_n = st.number_input("Top routes by Total (0 = all, rest summed as Other)", min_value=0, value=0,
+                                    step=5, key="pivot_top_n")
+        pivot_table = load_pivot(db_version, filters, granularity, top_n or None)
+
+        # Display pivot table (no matplotlib). Thousands separators come from the
+        # column config and are applied in the browser, not per cell in Python.
+        with timings.stage("render_pivot") as stage:
+            stage.count(pivot_table, size=False)
+            st.dataframe(
+                pivot_table,
+                column_config={col: st.column_config.NumberColumn(format="localized") for col in pivot_table.columns},
+                use_container_width=True,
+                height=400
+            )
+
+        export_section(
+            "Pivot Table",
+            partial(pivot_export, db_version, filters, granularity, top_n or None),
+            f"pivot_table_{filters.start_date}_{filters.end_date}",
+            key="pivot_format",
+            rows=len(pivot_table),
+        )
+
+@st.fragment
+def raw_section(db_version, filters, total_rows):
+    """Paged raw-data viewer and its export."""
+    with section_timings("raw"), st.expander("📋 View Filtered Raw Data"):
+        # Only one page at a time leaves DuckDB; the total comes from the summary metrics
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            sort_by = st.selectbox("Sort by", VIEW_COLUMNS["raw"], key="raw_sort_by")
+        with col2:
+            descending = st.toggle("Descending", key="raw_descending")
+        with col3:
+            page_size = st.selectbox("Rows per page", [100, 500, 1000, 5000], index=1, key="raw_page_size")
+        with col4:
+            page_count = max(1, math.ceil(total_rows / page_size))
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="raw_page")
+        page_data = load_raw_page(db_version, filters, page - 1, page_size, sort_by, descending)
+        first_row = (page - 1) * page_size
+        st.caption(
+            f"Page {page:,} of {page_count:,} · rows {first_row + 1:,}–{first_row + len(page_data):,} "
+            f"of {total_rows:,} · {memory_usage(page_data) / 1024:,.0f} KB in memory"
+        )
+        with timings.stage("render_raw_page") as stage:
+            stage.count(page_data)
+            st.dataframe(
+                page_data,
+                use_container_width=True,
+                height=300
+            )
+        # Product details are only fetched when someone asks for them
+        export_columns = VIEW_COLUMNS["raw"]
+        if st.checkbox("Include product details (Code, Description, Qty, Cake) in the download"):
+            export_columns = VIEW_COLUMNS["export"]
+        export_section(
+            "Raw Data",
+            partial(raw_export, db_version, filters, export_columns),
+            f"raw_data_{filters.start_date}_{filters.end_date}",
+            key="raw_format",
+            rows=total_rows,
+        )
+
+# ==============================================================
+# 5️⃣  Dashboard Logic
 # ==============================================================
 try:
-    data = load_data()
+    db_version = database_version()
+    if database().last_error is not None:
+        st.sidebar.warning(f"⚠️ Could not check for a newer database, using the local copy: {database().last_error}")
+    min_date, max_date, supervisors, crates_box = load_filter_options(db_version)
 
     st.sidebar.header("🔍 Filters")
 
     # Date Range Filter
     st.sidebar.subheader("Date Range")
-    min_date = data['Sales_Date'].min().date()
-    max_date = data['Sales_Date'].max().date()
     start_date = st.sidebar.date_input("From Date", value=min_date, min_value=min_date, max_value=max_date)
     end_date = st.sidebar.date_input("To Date", value=max_date, min_value=min_date, max_value=max_date)
 
     # Supervisor Filter
     st.sidebar.subheader("Supervisor")
-    supervisors = sorted(data['Supervisor'].dropna().unique().tolist())
     selected_supervisors = st.sidebar.multiselect("Select Supervisor(s)", options=supervisors, default=supervisors)
 
     # Crates/Box Filter
     st.sidebar.subheader("Crates/Box")
-    crates_box = sorted(data['Crates_Box'].dropna().unique().tolist())
     selected_crates_box = st.sidebar.multiselect("Select Crates/Box", options=crates_box, default=crates_box)
 
-    # Filtered Data
-    filtered_data = data[
-        (data['Sales_Date'].dt.date >= start_date)
-        & (data['Sales_Date'].dt.date <= end_date)
-        & (data['Supervisor'].isin(selected_supervisors))
-        & (data['Crates_Box'].isin(selected_crates_box))
-    ].copy()
+    filters = Filters.from_selection(start_date, end_date, selected_supervisors, selected_crates_box)
+    metrics = load_metrics(db_version, filters)
 
     # ==============================================================
     #  Summary Metrics
@@ -100,11 +300,11 @@ try:
     st.subheader("📈 Summary Metrics")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Records", f"{len(filtered_data):,}")
+        st.metric("Total Records", f"{metrics['records']:,}")
     with col2:
-        st.metric("Total Crt_Box", f"{filtered_data['Crt_Box'].sum():,.0f}")
+        st.metric("Total Crt_Box", f"{metrics['crt_box']:,.0f}")
     with col3:
-        st.metric("Unique Routes", f"{filtered_data['Route'].nunique()}")
+        st.metric("Unique Routes", f"{metrics['routes']}")
     with col4:
         st.metric("Date Range", f"{(end_date - start_date).days + 1} days")
 
@@ -115,47 +315,40 @@ try:
     # ==============================================================
     st.subheader("📊 Pivot Table: Sum of Crt_Box by Route and Date")
 
-    if not filtered_data.empty:
-        pivot_data = filtered_data.groupby(['Sales_Date', 'Route'])['Crt_Box'].sum().reset_index()
-        pivot_table = pivot_data.pivot(index='Route', columns='Sales_Date', values='Crt_Box')
-        pivot_table.columns = [col.strftime('%Y-%m-%d') for col in pivot_table.columns]
-        pivot_table['Total'] = pivot_table.sum(axis=1)
-        pivot_table = pivot_table.sort_values('Total', ascending=False).round(0)
-
-        # Display pivot table (no matplotlib)
-        st.dataframe(
-            pivot_table.style.format("{:,.0f}"),  # Show rounded integers with commas
-            use_container_width=True,
-            height=400
-        )
-
-        csv = pivot_table.to_csv()
-        st.download_button(
-            label="📥 Download Pivot Table as CSV",
-            data=csv,
-            file_name=f"pivot_table_{start_date}_{end_date}.csv",
-            mime="text/csv"
-        )
+    if metrics['records']:
+        pivot_section(db_version, filters)
 
         st.divider()
 
         # Raw Data View
-        with st.expander("📋 View Filtered Raw Data"):
-            st.dataframe(
-                filtered_data[['Sales_Date', 'Route', 'Crates_Box', 'Crt_Box', 'Supervisor']],
-                use_container_width=True,
-                height=300
-            )
-            raw_csv = filtered_data.to_csv(index=False)
-            st.download_button(
-                label="📥 Download Raw Data as CSV",
-                data=raw_csv,
-                file_name=f"raw_data_{start_date}_{end_date}.csv",
-                mime="text/csv"
-            )
+        raw_section(db_version, filters, metrics['records'])
     else:
         st.warning("⚠️ No data available for the selected filters.")
 
+    cache_stats = result_cache().stats()
+    st.sidebar.caption(
+        f"Result cache: {cache_stats['hits']:,} hits · {cache_stats['disk_hits']:,} from disk · "
+        f"{cache_stats['misses']:,} misses · "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1e6:,.1f} MB)"
+    )
+
+    # Where the last full rerun spent its time. Fragment reruns and exports
+    # (built when a download button is clicked) only show up in the logs.
+    if st.sidebar.toggle("⏱️ Performance", key="show_performance"):
+        with st.sidebar.expander("Performance", expanded=True):
+            st.metric("This rerun", f"{timings.elapsed() * 1000:,.0f} ms")
+            st.dataframe(
+                pd.DataFrame(timings.rows()),
+                column_config={
+                    "seconds": st.column_config.NumberColumn(format="%.4f"),
+                    "bytes": st.column_config.NumberColumn(format="localized"),
+                    "rows": st.column_config.NumberColumn(format="localized"),
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+    timings.finish()
+
 except Exception as e:
     st.error(f"❌ Error loading data: {str(e)}")
     st.info("Please make sure the Google Drive file is publicly accessible.")
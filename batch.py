@@ -0,0 +1,125 @@
+"""Headless report run: one Route x period pivot per Supervisor and Crates/Box.
+
+    python batch.py --output reports --format "Parquet (zstd)" --last-days 7
+    python batch.py --database dispatch.duckdb --url "$DISPATCH_URL" --workers 8 --granularity week
+
+Uses the same query and export code as the dashboard, without Streamlit.
+The database is copied and prepared once, then a process pool builds the
+pivots in parallel, each worker reading the prepared copy read-only.
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import duckdb
+
+from downloader import refresh_file
+from exports import EXPORT_FORMATS, export_pivot, load_excel
+from prepare import prepare_database
+from queries import GRANULARITIES, Filters, filter_options
+
+_worker_conn = None
+
+
+def _init_worker(path, threads):
+    global _worker_conn
+    _worker_conn = duckdb.connect(path, read_only=True, config={"threads": threads})
+
+
+def _build_report(filters, granularity, top_n, fmt, dest):
+    data = export_pivot(_worker_conn, filters, fmt, granularity, top_n)
+    if not data:
+        return None
+    with open(dest, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def slug(value):
+    """File-name-safe version of a supervisor or Crates/Box label."""
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(value)).strip("_") or "blank"
+
+
+def report_jobs(conn, output, fmt, start_date=None, end_date=None):
+    """``(filters, path)`` for every Supervisor x Crates/Box combination, defaulting to all dates."""
+    min_date, max_date, supervisors, crates_box = filter_options(conn)
+    start_date, end_date = start_date or min_date, end_date or max_date
+    extension = EXPORT_FORMATS[fmt][0]
+    return [
+        (Filters.from_selection(start_date, end_date, [supervisor], [kind]),
+         os.path.join(output, f"pivot_{slug(supervisor)}_{slug(kind)}_{start_date}_{end_date}.{extension}"))
+        for supervisor in supervisors
+        for kind in crates_box
+    ]
+
+
+def run_batch(database, output, fmt="CSV", granularity="day", top_n=None, start_date=None, end_date=None,
+              workers=None):
+    """Write every per-supervisor pivot into ``output`` and return ``{path: bytes}`` of the files written.
+
+    Combinations without any sales are skipped. ``database`` is never
+    modified: it is prepared in a temporary copy. DuckDB threads are split
+    between the worker processes so the pool does not oversubscribe the CPU.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, os.path.basename(database))
+        shutil.copyfile(database, prepared)
+        with duckdb.connect(prepared) as conn:
+            prepare_database(conn)
+            jobs = report_jobs(conn, output, fmt, start_date, end_date)
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        written = {}
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(prepared, threads)) as pool:
+            futures = {
+                pool.submit(_build_report, filters, granularity, top_n, fmt, path): path
+                for filters, path in jobs
+            }
+            for future in as_completed(futures):
+                size = future.result()
+                if size is not None:
+                    written[futures[future]] = size
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="dispatch.duckdb")
+    parser.add_argument("--url", help="download or refresh --database from this URL first")
+    parser.add_argument("--output", default="reports")
+    parser.add_argument("--format", default="CSV", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--granularity", default="day", choices=list(GRANULARITIES))
+    parser.add_argument("--top-n", type=int, help="keep the top N routes and sum the rest as Other")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day (default: first day in the data)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day (default: last day in the data)")
+    parser.add_argument("--last-days", type=int, help="only the last N days up to --end or today")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    if args.url:
+        refresh_file(args.url, args.database)
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} does not exist; pass --url to download it")
+    if args.format == "Excel" and not load_excel(duckdb.connect()):
+        parser.error("DuckDB's excel extension could not be installed; pick another --format")
+    start_date, end_date = args.start, args.end
+    if args.last_days:
+        end_date = end_date or date.today()
+        start_date = end_date - timedelta(days=args.last_days - 1)
+
+    started = time.perf_counter()
+    written = run_batch(args.database, args.output, args.format, args.granularity, args.top_n,
+                        start_date, end_date, args.workers)
+    print(f"wrote {len(written)} reports ({sum(written.values()) / 1e6:,.1f} MB) to {args.output} "
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
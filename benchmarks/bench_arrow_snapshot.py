@@ -0,0 +1,127 @@
+"""Compare serving raw rows from the prepared DuckDB snapshot against a
+memory-mapped Arrow IPC snapshot of the joined, typed dataset.
+
+    python benchmarks/bench_arrow_snapshot.py --rows 10M
+
+The Arrow variant writes ``SALES_QUERY`` once (sorted by date, compact
+types, uncompressed IPC) and opens it with ``pyarrow.memory_map``; DuckDB
+then scans the mapped table. Cold start is measured in a fresh Python
+process per variant: open the data and fetch the first raw page.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import duckdb
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prepare import prepare_database  # noqa: E402
+from queries import (SALES_QUERY, VIEW_COLUMNS, Filters, compact_types, fetch_arrow,  # noqa: E402
+                     filter_options, filtered_query)
+from synthetic import make_dispatch_database, parse_rows  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = {
+    "DuckDB snapshot": """
+import duckdb
+conn = duckdb.connect({database!r}, read_only=True)
+""",
+    "Arrow IPC (mmap)": """
+import duckdb, pyarrow as pa
+table = pa.ipc.open_file(pa.memory_map({arrow!r})).read_all()
+conn = duckdb.connect()
+conn.register("sales_joined", table)
+""",
+}
+
+FIRST_PAGE = """
+import time
+start = time.perf_counter()
+{setup}
+conn.execute({query!r}).fetchall()
+print(time.perf_counter() - start)
+"""
+
+
+def write_arrow_snapshot(conn, path):
+    table = compact_types(fetch_arrow(conn.execute(f"SELECT * FROM ({SALES_QUERY}) ORDER BY Sales_Date, Route")))
+    with pa.ipc.new_file(path, table.schema) as writer:
+        writer.write_table(table)
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def cold_start(setup, query, repeat):
+    script = FIRST_PAGE.format(setup=setup, query=query)
+    return min(
+        float(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                             cwd=ROOT).stdout)
+        for _ in range(repeat)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=parse_rows, default=parse_rows("1M"))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database, arrow = os.path.join(tmp, "dispatch.duckdb"), os.path.join(tmp, "dispatch.arrow")
+        with make_dispatch_database(database, args.rows) as conn:
+            prepare_database(conn)
+            start = time.perf_counter()
+            write_arrow_snapshot(conn, arrow)
+            build_time = time.perf_counter() - start
+
+        conn = duckdb.connect(database, read_only=True)
+        mapped = duckdb.connect()
+        mapped.register("sales_joined", pa.ipc.open_file(pa.memory_map(arrow)).read_all())
+        min_date, max_date, supervisors, crates_box = filter_options(conn)
+        month = Filters.from_selection(max_date - timedelta(days=30), max_date, supervisors, crates_box)
+        everything = Filters.from_selection(min_date, max_date, supervisors, crates_box)
+        order = ", ".join(VIEW_COLUMNS["raw"])
+        cases = {}
+        for label, filters, suffix in (
+            ("one month, all rows", month, ""),
+            ("first page", everything, f" ORDER BY {order} LIMIT 500"),
+            ("deep page by Route", everything,
+             f" ORDER BY Route, {order} LIMIT 500 OFFSET {max(0, args.rows - 1000)}"),
+        ):
+            query, params = filtered_query(filters)
+            cases[label] = (query + suffix, query.replace(f"({SALES_QUERY})", "sales_joined") + suffix, params)
+
+        print(f"rows:                 {args.rows:,}")
+        print(f"DuckDB file:          {os.path.getsize(database) / 1e6:10,.1f} MB")
+        print(f"Arrow IPC file:       {os.path.getsize(arrow) / 1e6:10,.1f} MB (built in {build_time:.2f} s)")
+        print(f"{'':22} {'DuckDB':>10} {'Arrow mmap':>10}")
+        native_first, arrow_first, first_params = cases["first page"]
+        cold = []
+        for setup, query in zip(COLD_START.values(), (native_first, arrow_first)):
+            # Literal parameters so the cold-start scripts need no imports from the repo
+            for value in first_params:
+                query = query.replace("?", f"'{value}'", 1)
+            cold.append(cold_start(setup.format(database=database, arrow=arrow), query, args.repeat))
+        print(f"{'cold start + page 1':22} {cold[0]:9.3f}s {cold[1]:9.3f}s")
+        for label, (native, arrow_query, params) in cases.items():
+            native_time = best_of(lambda: conn.execute(native, params).fetchall(), args.repeat)
+            arrow_time = best_of(lambda: mapped.execute(arrow_query, params).fetchall(), args.repeat)
+            print(f"{label:22} {native_time:9.3f}s {arrow_time:9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
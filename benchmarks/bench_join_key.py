@@ -0,0 +1,60 @@
+"""Time the sales/products join with the legacy TRIM(CAST(...)) condition
+against the precomputed integer Code_Key.
+
+    python benchmarks/bench_join_key.py --rows 5000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prepare import prepare_database  # noqa: E402
+from queries import SALES_QUERY  # noqa: E402
+from synthetic import make_dispatch_database, parse_rows  # noqa: E402
+
+KEYED_JOIN = "s.Code_Key = p.Code_Key"
+LEGACY_JOIN = "TRIM(CAST(s.Code AS VARCHAR)) = TRIM(CAST(p.Code AS VARCHAR))"
+
+
+def best_of(conn, query, repeat, fetch):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(query)
+        result.fetchdf() if fetch else result.fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=parse_rows, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = make_dispatch_database(os.path.join(tmp, "bench.duckdb"), args.rows)
+        start = time.perf_counter()
+        prepare_database(conn)
+        prepare_time = time.perf_counter() - start
+
+        results = {}
+        for name, query in (("TRIM/CAST", SALES_QUERY.replace(KEYED_JOIN, LEGACY_JOIN)), ("Code_Key", SALES_QUERY)):
+            # The aggregate isolates the join; the full fetch is what load_data() pays
+            join_only = f"SELECT COUNT(*), SUM(Crt_Box), COUNT(Supervisor) FROM ({query})"
+            results[name] = (best_of(conn, join_only, args.repeat, fetch=False),
+                             best_of(conn, query, args.repeat, fetch=True))
+        conn.close()
+
+    print(f"rows:              {args.rows:,}")
+    print(f"one-time prepare:  {prepare_time:8.3f} s")
+    print(f"{'':18} {'join':>8}   {'fetchdf':>8}")
+    for name, (join_time, load_time) in results.items():
+        print(f"{name:18} {join_time:8.3f} s {load_time:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compare server-side render time of the pivot with the pandas Styler
+against a plain frame with column-config number formatting.
+
+    python benchmarks/bench_pivot_render.py --routes 500 --days 365
+
+Each variant runs as a one-element Streamlit script through AppTest, which
+includes building the display object and marshalling it to Arrow for the
+browser. Browser-side paint time is not measured.
+"""
+import argparse
+import time
+
+from streamlit.testing.v1 import AppTest
+
+SETUP = """
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+rng = np.random.default_rng(0)
+pivot_table = pd.DataFrame(
+    rng.integers(0, 5000, ({routes}, {days})).astype(float),
+    index=pd.Index([f"R{{i:03d}}" for i in range({routes})], name="Route"),
+    columns=pd.date_range("2024-01-01", periods={days}).strftime("%Y-%m-%d"),
+)
+pivot_table["Total"] = pivot_table.sum(axis=1)
+"""
+
+VARIANTS = {
+    "Styler.format": """
+st.dataframe(pivot_table.style.format("{{:,.0f}}"), height=400)
+""",
+    "column_config": """
+st.dataframe(
+    pivot_table,
+    column_config={{column: st.column_config.NumberColumn(format="localized") for column in pivot_table.columns}},
+    height=400,
+)
+""",
+}
+
+
+def time_script(script, repeat):
+    timings = []
+    for _ in range(repeat):
+        app = AppTest.from_string(script, default_timeout=600)
+        start = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    setup = SETUP.format(routes=args.routes, days=args.days)
+    baseline = time_script(setup, args.repeat)
+    print(f"pivot: {args.routes} routes x {args.days} days")
+    for name, body in VARIANTS.items():
+        elapsed = time_script(setup + body.format(), args.repeat) - baseline
+        print(f"{name:15} {elapsed:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
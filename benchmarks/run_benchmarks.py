@@ -0,0 +1,148 @@
+"""Time every dashboard stage against synthetic databases and write the results as JSON.
+
+    python benchmarks/run_benchmarks.py --sizes 1M 10M --output bench_results.json
+    python benchmarks/run_benchmarks.py --database dispatch.duckdb
+
+Each size gets a fresh database from synthetic.py (or ``--database`` is
+used as-is, on a copy), which is prepared the way the app prepares a
+download. The stages then run through the same functions the dashboard
+calls, with the widest filters (all dates, supervisors and Crates/Box
+values) and a one-month window. Every stage reports the best of
+``--repeat`` runs plus the individual timings, with row and byte counts
+of its result.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exports import export_pivot, export_raw  # noqa: E402
+from instrumentation import Stage  # noqa: E402
+from prepare import prepare_database  # noqa: E402
+from queries import (SALES_QUERY, Filters, filter_options, load_filtered, load_page,  # noqa: E402
+                     route_date_pivot, summary_metrics)
+from synthetic import make_dispatch_database, parse_rows  # noqa: E402
+
+
+def run_stage(name, function, repeat):
+    """Best-of-``repeat`` timing of ``function()`` with the size of its last result."""
+    stage = Stage(stage=name)
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        runs.append(round(time.perf_counter() - start, 6))
+    stage.count(value)
+    stage["seconds"] = min(runs)
+    stage["runs"] = runs
+    print(f"  {name:32} {stage['seconds']:9.4f} s  {stage.get('rows', ''):>12}")
+    return stage
+
+
+def dashboard_stages(conn, repeat):
+    """Stages of one dashboard rerun, cold-cache, in the order the script runs them."""
+    min_date, max_date, supervisors, crates_box = filter_options(conn)
+    everything = Filters.from_selection(min_date, max_date, supervisors, crates_box)
+    month = Filters.from_selection(max(min_date, max_date - timedelta(days=30)), max_date, supervisors, crates_box)
+    last_page = max(0, summary_metrics(conn, everything)["records"] // 500 - 1)
+    stages = [
+        ("filter_options", lambda: filter_options(conn)),
+        ("metrics (all dates)", lambda: summary_metrics(conn, everything)),
+        ("metrics (one month)", lambda: summary_metrics(conn, month)),
+        ("pivot by day (all dates)", lambda: route_date_pivot(conn, everything, "day")),
+        ("pivot by week (all dates)", lambda: route_date_pivot(conn, everything, "week")),
+        ("pivot by month (all dates)", lambda: route_date_pivot(conn, everything, "month")),
+        ("pivot by day, top 20 (all dates)", lambda: route_date_pivot(conn, everything, "day", 20)),
+        ("pivot by day (one month)", lambda: route_date_pivot(conn, month, "day")),
+        ("raw first page", lambda: load_page(conn, everything, 0, 500, arrow=True)),
+        ("raw last page by Route", lambda: load_page(conn, everything, last_page, 500, "Route", arrow=True)),
+        ("raw rows (one month, arrow)", lambda: load_filtered(conn, month, arrow=True)),
+        ("export raw parquet (one month)", lambda: export_raw(conn, month, "Parquet (zstd)")),
+        ("export pivot csv (all dates)", lambda: export_pivot(conn, everything, "CSV")),
+        # What the original script paid on every cold start: the whole joined table in pandas
+        ("full load_data fetchdf", lambda: conn.execute(SALES_QUERY).fetchdf()),
+    ]
+    return [run_stage(name, function, repeat) for name, function in stages]
+
+
+def benchmark(path, repeat, threads=None):
+    """Prepare the database at ``path`` in place and time every stage on it."""
+    results = []
+    with duckdb.connect(path) as conn:
+        results.append(run_stage("prepare_database", lambda: prepare_database(conn), 1))
+    config = {"threads": threads} if threads else {}
+    with duckdb.connect(path, read_only=True, config=config) as conn:
+        results.extend(dashboard_stages(conn, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=parse_rows, default=[parse_rows("1M")],
+                        help="sales rows per database: 1M, 10M, 100M or numbers")
+    parser.add_argument("--database", help="benchmark a copy of this file instead of generating data")
+    parser.add_argument("--routes", type=int, default=300)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--messy-codes", type=float, default=0.25)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, help="DuckDB threads (default: all cores)")
+    parser.add_argument("--workdir", help="where to write the databases (default: a temporary directory)")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "duckdb": duckdb.__version__,
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+            "threads": args.threads,
+        },
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        path = os.path.join(tmp, "dispatch.duckdb")
+        if args.database:
+            targets = [({"database": os.path.abspath(args.database)}, None)]
+        else:
+            targets = [
+                ({"rows": rows, "routes": args.routes, "products": args.products, "days": args.days,
+                  "messy_codes": args.messy_codes}, rows)
+                for rows in args.sizes
+            ]
+        for params, rows in targets:
+            print(", ".join(f"{key}={value:,}" if isinstance(value, int) else f"{key}={value}"
+                            for key, value in params.items()))
+            start = time.perf_counter()
+            if rows is None:
+                shutil.copyfile(args.database, path)
+            else:
+                make_dispatch_database(path, rows, args.routes, args.products, args.days,
+                                       messy_codes=args.messy_codes).close()
+            params["setup_seconds"] = round(time.perf_counter() - start, 3)
+            params["file_bytes"] = os.path.getsize(path)
+            report["runs"].append({"params": params, "stages": benchmark(path, args.repeat, args.threads)})
+            os.remove(path)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Write a synthetic dispatch.duckdb with the same tables as the real file.
+
+    python benchmarks/synthetic.py dispatch.duckdb --rows 10M --routes 300 --products 2000 --days 1000
+
+The data is deterministic for a given ``--seed``. Like the real export,
+``sales.Code`` is text with a share of values padded by spaces, some codes
+have no product, some routes have no supervisor and some products have
+``Cake = 0``. Product popularity is skewed so a few products dominate.
+"""
+import argparse
+import os
+import time
+
+import duckdb
+
+SIZES = {"1M": 1_000_000, "10M": 10_000_000, "100M": 100_000_000}
+
+
+def parse_rows(value):
+    """Row count from ``"10M"``-style presets or plain integers (``"2_000_000"``)."""
+    return SIZES.get(value.upper()) or int(value.replace("_", ""))
+
+
+def make_dispatch_database(path, rows, routes=300, products=2000, days=1000, supervisors=12,
+                           messy_codes=0.25, unknown_codes=0.01, start_date="2022-01-01",
+                           ordered=False, seed=0):
+    """Create ``path`` with ``sales``, ``Products`` and ``Supervisors`` and return the open connection.
+
+    ``messy_codes`` is the share of sales codes padded with spaces and
+    ``unknown_codes`` the share that match no product. With ``ordered`` the
+    sales rows come in date order, otherwise dates are scattered through
+    the table.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = duckdb.connect(path)
+
+    def uniform(i, salt):
+        # Deterministic value in [0, 1) per row; random() would depend on thread scheduling
+        return f"(hash({i}, {salt}, {seed}) % 1000000) / 1000000.0"
+
+    conn.execute(f"""
+        CREATE TABLE Products AS
+        SELECT i AS Code,
+               'Product ' || i AS Description,
+               CASE WHEN i % 50 = 0 THEN 0 ELSE 6 + i % 20 END AS Cake,
+               CASE WHEN i % 3 = 0 THEN 'Box' ELSE 'Crates' END AS Cr_Bo
+        FROM range(1, {products} + 1) t(i)
+    """)
+    # About 2% of routes are missing from Supervisors
+    conn.execute(f"""
+        CREATE TABLE Supervisors AS
+        SELECT 'R' || lpad(CAST(i AS VARCHAR), 4, '0') AS Route,
+               'Supervisor ' || (i % {supervisors} + 1) AS Supervisor
+        FROM range(0, {routes}) t(i)
+        WHERE i % 50 <> 49
+    """)
+    date_offset = f"(i * {days}) // {rows}" if ordered else f"floor({uniform('i', 1)} * {days})"
+    conn.execute(f"""
+        CREATE TABLE sales AS
+        SELECT
+            CASE
+                WHEN pad < {messy_codes / 3} THEN ' ' || code
+                WHEN pad < {2 * messy_codes / 3} THEN code || ' '
+                WHEN pad < {messy_codes} THEN '  ' || code || '  '
+                ELSE code
+            END AS Code,
+            Sales_Date,
+            Qty,
+            Route
+        FROM (
+            SELECT
+                CAST(CASE
+                    WHEN {uniform('i', 2)} < {unknown_codes} THEN {products} + 1 + i % 100
+                    ELSE 1 + floor(pow({uniform('i', 3)}, 2) * {products})
+                END AS BIGINT)::VARCHAR AS code,
+                {uniform('i', 4)} AS pad,
+                CAST(DATE '{start_date}' + CAST({date_offset} AS INTEGER) AS DATE) AS Sales_Date,
+                CAST(1 + floor(pow({uniform('i', 5)}, 3) * 400) AS INTEGER) AS Qty,
+                'R' || lpad(CAST(CAST(floor({uniform('i', 6)} * {routes}) AS INTEGER) AS VARCHAR), 4, '0') AS Route
+            FROM range(0, {rows}) t(i)
+        )
+    """)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=parse_rows, default=SIZES["1M"], help="1M, 10M, 100M or a number")
+    parser.add_argument("--routes", type=int, default=300)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--supervisors", type=int, default=12)
+    parser.add_argument("--messy-codes", type=float, default=0.25)
+    parser.add_argument("--unknown-codes", type=float, default=0.01)
+    parser.add_argument("--ordered", action="store_true", help="write sales in date order")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    make_dispatch_database(args.path, args.rows, args.routes, args.products, args.days, args.supervisors,
+                           args.messy_codes, args.unknown_codes, ordered=args.ordered, seed=args.seed).close()
+    print(f"wrote {args.rows:,} sales rows to {args.path} in {time.perf_counter() - start:.1f} s "
+          f"({os.path.getsize(args.path) / 1e6:,.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
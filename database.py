@@ -0,0 +1,355 @@
+import fnmatch
+import glob
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import duckdb
+
+from downloader import read_metadata, refresh_file
+from ingest import (APPENDED_TABLES, archive_files, claim_files, create_delta_database, ingest_directory,
+                    ingested_digest)
+from instrumentation import timed
+from prepare import prepare_database
+from queries import ROLLUP_TABLE, sql_literal
+
+try:
+    import fcntl
+except ImportError:  # Windows: ingests are not serialized between processes, only within one
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Staging copies younger than this may belong to another process sharing the directory
+STALE_STAGING_SECONDS = 24 * 60 * 60
+
+
+class DatabaseManager:
+    """Serves the current database snapshot read-only and swaps in new versions without blocking readers.
+
+    ``path`` is the pristine download (kept for conditional refreshes). Each
+    downloaded version is prepared once into ``<name>-<version>.duckdb``,
+    which is never written to afterwards. Ingested sales deltas go into a
+    small ``<name>-<version>-delta-<digest>.duckdb`` next to it instead of a
+    copy of the whole snapshot (see :func:`ingest.create_delta_database`);
+    sessions query an in-memory catalog that attaches both read-only and
+    exposes each table as a view, with ``sales`` and the rollup unioned
+    across the two. Applying a delta therefore copies only earlier deltas,
+    not the snapshot.
+
+    Every change is written to a staging file and swapped in, so sessions
+    keep querying the old files until the new ones are fully ready. File
+    names are derived from their content -- the download's SHA-256 and the
+    hash of the ingested file names and hashes -- so a file is never
+    replaced with different data. Processes sharing the directories take
+    turns ingesting under an exclusive ``flock`` on ``ingest_dir/.lock``:
+    each one first switches to the newest delta (which holds every file
+    ingested so far, by any of them), claims the pending files and writes
+    the next delta on top of it, so all processes serve the same data
+    within one poll. A replaced connection is closed and its files deleted only
+    ``retire_after`` seconds later, so queries already running on it
+    finish even when several swaps follow each other.
+
+    Every thread gets its own cursor, since a single DuckDB connection must
+    not run queries from several threads at once. ``threads`` /
+    ``memory_limit`` are passed to DuckDB as-is (e.g. ``4`` / ``"2GB"``).
+
+    ``version`` identifies the downloaded data and is meant to be part of
+    cache keys. Ingesting deltas keeps the version and calls
+    ``on_ingest(first_date, last_date)`` instead, so callers can drop only the
+    cache entries for the affected days.
+    """
+
+    def __init__(self, url, path, refresh_interval, ingest_dir=None, on_ingest=None,
+                 poll_interval=60, threads=None, memory_limit=None, retire_after=600):
+        self.url = url
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.ingest_dir = ingest_dir
+        self.on_ingest = on_ingest
+        self.poll_interval = poll_interval
+        self.retire_after = retire_after
+        self.config = {key: value for key, value in (("threads", threads), ("memory_limit", memory_limit)) if value}
+        self.version = None
+        self.last_error = None
+        self._failed_version = None  # download that could not be prepared, skipped until it changes
+        self._conn = None
+        self._snapshot = None  # prepared download being served
+        self._delta = None  # its delta database, None until something is ingested
+        self._retired = []  # (connection, files, retired_at) of replaced connections
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def data_id(self):
+        """Content identity of the data being served: ``<version>`` or ``<version>-<delta digest>``.
+
+        Unlike file names it is the same in every process serving the same
+        download and ingested files, whatever their paths, so it can name
+        results shared between replicas.
+        """
+        with self._lock:
+            version, delta = self.version, self._delta
+        if delta is None:
+            return version
+        digest = os.path.splitext(delta)[0].rsplit("-", 1)[1]
+        return f"{version}-{digest}"
+
+    def snapshot_path(self, version):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}-{version}{ext}"
+
+    def delta_path(self, version, digest):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}-{version}-delta-{digest}{ext}"
+
+    def _delta_pattern(self, version):
+        root, ext = os.path.splitext(self.path)
+        return f"{glob.escape(root)}-{version}-delta-*{ext}"
+
+    def connection(self):
+        """Cursor on the current snapshot, private to the calling thread."""
+        with self._lock:
+            conn = self._conn
+        local = self._local
+        if getattr(local, "conn", None) is not conn:
+            local.cursor = conn.cursor()
+            local.conn = conn
+        return local.cursor
+
+    def open(self, progress=None):
+        """Open the local snapshot, downloading the database first only if there is none."""
+        if not os.path.exists(self.path):
+            refresh_file(self.url, self.path, progress=progress, validate=self._check_download)
+        self._activate(self._downloaded_version())
+        self._remove_stale_snapshots()
+
+    def refresh(self):
+        """Re-download if the remote changed, prepare it side by side and swap."""
+        refresh_file(self.url, self.path, interval=self.refresh_interval, validate=self._check_download)
+        version = self._downloaded_version()
+        if version not in (self.version, self._failed_version):
+            with timed("activate_snapshot", version=version):
+                try:
+                    self._activate(version)
+                except Exception:
+                    # Preparing a multi-GB copy again on every poll would not help; wait for a new download
+                    self._failed_version = version
+                    raise
+            logger.info("Swapped in database version %s", version)
+
+    def ingest(self):
+        """Catch up with deltas ingested by other processes, then apply the pending ones and swap them in.
+
+        Returns the date range that changed, or None.
+        """
+        if not self.ingest_dir:
+            return None
+        with self._write_lock, self._ingest_lock():
+            ranges = [changed for changed in (self._follow_latest_delta(), self._ingest_pending()) if changed]
+        if not ranges:
+            return None
+        changed = min(first for first, _ in ranges), max(last for _, last in ranges)
+        logger.info("Ingested sales for %s - %s", *changed)
+        if self.on_ingest is not None:
+            self.on_ingest(*changed)
+        return changed
+
+    @contextmanager
+    def _ingest_lock(self):
+        os.makedirs(self.ingest_dir, exist_ok=True)
+        with open(os.path.join(self.ingest_dir, ".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _follow_latest_delta(self):
+        # Under the ingest lock the newest delta contains all earlier ones
+        latest = self._latest_delta(self.version)
+        if latest is None or latest == self._delta:
+            return None
+        self._swap(self.version, self._snapshot, latest)
+        with self._lock:
+            cursor = self._conn.cursor()
+        # Which rows are new to this process is not recorded, so every day in the delta counts as changed
+        first_date, last_date = cursor.execute(
+            f"SELECT CAST(MIN(Sales_Date) AS DATE), CAST(MAX(Sales_Date) AS DATE) FROM delta.{ROLLUP_TABLE}"
+        ).fetchone()
+        return (first_date, last_date) if first_date is not None else None
+
+    def _ingest_pending(self):
+        claimed = os.path.join(self.ingest_dir, "claimed")
+        if not claim_files(self.ingest_dir, claimed):
+            return None
+        with timed("ingest", version=self.version) as stage:
+            staging = self._staging_path()
+            try:
+                if self._delta is not None:
+                    shutil.copyfile(self._delta, staging)
+                else:
+                    create_delta_database(staging, self._snapshot)
+                with duckdb.connect(staging) as conn:
+                    paths, failed, first_date, last_date = ingest_directory(conn, claimed)
+                    digest = ingested_digest(conn)
+                # Nothing from these is in the database, so they can be set aside right away
+                archive_files(self.ingest_dir, failed, "failed")
+                stage["failed"] = len(failed)
+                if first_date is not None:
+                    stage["first_date"], stage["last_date"] = first_date, last_date
+                    stage["delta_bytes"] = os.path.getsize(staging)
+                    target = self.delta_path(self.version, digest)
+                    if os.path.exists(target):
+                        # Written before by a crashed attempt with the same files; it is identical
+                        os.utime(target)
+                    else:
+                        os.replace(staging, target)
+                    self._swap(self.version, self._snapshot, target)
+            finally:
+                # Gone already when it became the new delta
+                self._remove_files(staging)
+            # Only now are the rows durable in the served files; until here a
+            # crash leaves the files claimed and the retry skips what was recorded
+            archive_files(self.ingest_dir, paths)
+        return (first_date, last_date) if first_date is not None else None
+
+    def start(self):
+        """Start the background refresher thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="database-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Polls often; refresh_file() itself only contacts the remote once per refresh_interval
+        while True:
+            try:
+                self.refresh()
+                self.ingest()
+                with self._write_lock:
+                    self._close_retired()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                logger.exception("Background database refresh failed")
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def _downloaded_version(self):
+        sha256 = read_metadata(self.path).get("sha256")
+        if sha256:
+            return sha256[:12]
+        # A file put in place by hand: size and mtime tell copies apart without hashing gigabytes on every poll
+        stat = os.stat(self.path)
+        return f"local{stat.st_size:x}{stat.st_mtime_ns:x}"
+
+    def _staging_path(self):
+        # Unique per call, so processes sharing the directory never write the same staging file
+        root, ext = os.path.splitext(self.path)
+        return f"{root}-{uuid.uuid4().hex[:8]}{ext}.tmp"
+
+    def _latest_delta(self, version):
+        # Reuse the newest delta of this version: each one contains all earlier ingests
+        deltas = glob.glob(self._delta_pattern(version))
+        return max(deltas, key=os.path.getmtime, default=None)
+
+    def _activate(self, version):
+        target = self.snapshot_path(version)
+        with self._write_lock:
+            if not os.path.exists(target):
+                staging = self._staging_path()
+                try:
+                    shutil.copyfile(self.path, staging)
+                    with duckdb.connect(staging) as conn:
+                        prepare_database(conn)
+                    os.replace(staging, target)
+                finally:
+                    self._remove_files(staging)
+            self._swap(version, target, self._latest_delta(version))
+
+    def _connect(self, snapshot, delta):
+        conn = duckdb.connect(config=self.config)
+        conn.execute(f"ATTACH {sql_literal(snapshot)} AS snapshot (READ_ONLY)")
+        tables = [row[0] for row in conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = 'snapshot'"
+        ).fetchall()]
+        if delta is not None:
+            conn.execute(f"ATTACH {sql_literal(delta)} AS delta (READ_ONLY)")
+        for table in tables:
+            query = f"SELECT * FROM snapshot.{table}"
+            if delta is not None and table in APPENDED_TABLES:
+                query += f" UNION ALL BY NAME SELECT * FROM delta.{table}"
+            conn.execute(f"CREATE VIEW {table} AS {query}")
+        return conn
+
+    def _swap(self, version, snapshot, delta):
+        conn = self._connect(snapshot, delta)
+        with self._lock:
+            previous = (self._conn, self._files()) if self._conn is not None else None
+            self._conn, self._snapshot, self._delta = conn, snapshot, delta
+            self.version = version
+        if previous is not None:
+            self._retire(previous)
+
+    def _files(self):
+        return tuple(path for path in (self._snapshot, self._delta) if path is not None)
+
+    def _retire(self, previous):
+        # Replaced connections stay open for retire_after seconds, so queries that
+        # started on them -- even across several quick swaps -- can finish.
+        self._retired.append((*previous, time.monotonic()))
+        self._close_retired()
+
+    def _close_retired(self):
+        with self._lock:
+            current = set(self._files())
+        deadline = time.monotonic() - self.retire_after
+        keep = [retired for retired in self._retired if retired[2] > deadline]
+        in_use = current.union(*(files for _, files, _ in keep))
+        for conn, files, retired_at in self._retired:
+            if retired_at > deadline:
+                continue
+            conn.close()
+            for path in files:
+                if path not in in_use:
+                    self._remove_files(path)
+        self._retired = keep
+
+    def _remove_stale_snapshots(self):
+        root, ext = os.path.splitext(self.path)
+        current = self._files()
+        recent = time.time() - self.retire_after
+        for path in glob.glob(f"{glob.escape(root)}-*{ext}"):
+            if path in current:
+                continue
+            # A newer delta of this version may be served by another process sharing the directory
+            if fnmatch.fnmatch(path, self._delta_pattern(self.version)) and os.path.getmtime(path) > recent:
+                continue
+            self._remove_files(path)
+        # Staging files left behind by a crash; their work is redone from the pending files
+        stale = time.time() - STALE_STAGING_SECONDS
+        for path in glob.glob(f"{glob.escape(root)}-*{ext}.tmp"):
+            if os.path.getmtime(path) < stale:
+                self._remove_files(path)
+
+    @staticmethod
+    def _check_download(path):
+        # Google Drive answers large files with an HTML page that would otherwise replace the database
+        with duckdb.connect(path, read_only=True) as conn:
+            conn.execute("SELECT 1 FROM sales LIMIT 1")
+
+    @staticmethod
+    def _remove_files(path):
+        for name in (path, path + ".wal"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
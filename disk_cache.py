@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:  # Windows: evictions are not serialized, which only costs duplicate work
+    fcntl = None
+
+SUFFIX = ".arrow"
+KIND = b"dispatch.kind"
+
+
+def to_arrow(value):
+    """``value`` as an Arrow table tagged with its Python type, or None if it cannot be stored."""
+    if isinstance(value, pa.Table):
+        table, kind = value, "table"
+    elif isinstance(value, pd.DataFrame):
+        table, kind = pa.Table.from_pandas(value, preserve_index=True), "pandas"
+    elif isinstance(value, (bytes, bytearray)):
+        table, kind = pa.table({"data": pa.array([bytes(value)], pa.large_binary())}), "bytes"
+    elif isinstance(value, dict):
+        table, kind = pa.table({"json": [json.dumps(value)]}), "json"
+    else:
+        return None
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), KIND: kind.encode()})
+
+
+def from_arrow(table):
+    kind = table.schema.metadata[KIND].decode()
+    if kind == "pandas":
+        return table.to_pandas()
+    if kind == "bytes":
+        return table.column("data")[0].as_py()
+    if kind == "json":
+        return json.loads(table.column("json")[0].as_py())
+    return table.replace_schema_metadata({key: value for key, value in table.schema.metadata.items() if key != KIND})
+
+
+class DiskCache:
+    """Result files shared by every process on the host, bounded in total bytes.
+
+    Each value is one Arrow IPC file named after a hash of the
+    ``namespace`` passed to ``get`` / ``put`` and ``repr(key)`` -- keys are tuples of strings, numbers, dates and
+    ``Filters``, whose reprs are stable across processes. ``namespace``
+    must identify the underlying data by content, not by anything local to
+    one process (e.g. ``DatabaseManager.data_id``), so entries never need
+    explicit invalidation and processes sharing the directory never read
+    each other's results for different data; stale entries simply stop
+    being read and age out.
+
+    Files are written to a temporary name and renamed into place, so
+    readers only ever see complete files and concurrent writers of the
+    same key just replace each other. Reads touch the file's mtime and
+    eviction removes the least recently used files first, under an
+    exclusive ``flock`` so only one process sweeps at a time.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, namespace=""):
+        digest = hashlib.sha256(f"{namespace}\0{key!r}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:32] + SUFFIX)
+
+    def get(self, key, namespace=""):
+        """The stored value for ``key`` in ``namespace``, or None."""
+        path = self.path(key, namespace)
+        try:
+            with pa.OSFile(path) as f:
+                table = pa.ipc.open_file(f).read_all()
+            os.utime(path)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        return from_arrow(table)
+
+    def put(self, key, value, namespace=""):
+        table = to_arrow(value)
+        if table is None or table.nbytes > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, self.path(key, namespace))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used files until the directory fits in ``max_bytes``."""
+        with self._lock, open(os.path.join(self.directory, ".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:  # already evicted by another process, or still open on Windows
+                    continue
+                total -= size
+
+    def stats(self):
+        files = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(SUFFIX)]
+        return {"files": len(files), "bytes": sum(os.path.getsize(path) for path in files if os.path.exists(path))}
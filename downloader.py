@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB per read keeps memory flat for multi-GB files
+MAX_RETRIES = 5
+TIMEOUT = 60
+META_SUFFIX = ".meta.json"
+
+
+def _total_size(response, offset):
+    """Work out the full file size from a (possibly partial) response."""
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return offset + int(length)
+    return None
+
+
+def download_file(url, dest, chunk_size=CHUNK_SIZE, progress=None, headers=None,
+                  max_retries=MAX_RETRIES, timeout=TIMEOUT):
+    """Stream ``url`` into ``dest`` in chunks, resuming interrupted transfers.
+
+    Data is written to ``dest + ".part"`` and only renamed over ``dest`` once
+    the whole file has arrived, so readers never see a half-written file.
+    The remote's ETag / Last-Modified is stored next to the ``.part`` file
+    when a transfer starts, and a leftover ``.part`` file from an earlier run
+    is resumed with an HTTP ``Range`` request conditional on it
+    (``If-Range``): if the remote changed meanwhile the server sends the
+    whole new file instead. A ``.part`` file without a stored validator
+    cannot be checked and is discarded. Servers that ignore ranges simply
+    restart from zero.
+    ``progress(done, total)`` is called after every chunk (``total`` may be
+    ``None`` when the server does not send a size).
+
+    Extra request ``headers`` (e.g. ``If-None-Match``) are sent with the first
+    request. Returns the headers of the final response, or ``None`` when the
+    server answered ``304 Not Modified`` and nothing was downloaded.
+    """
+    part = dest + ".part"
+    headers = dict(headers or {})
+    response_headers = {}
+    validator = read_metadata(part).get("validator")
+    if validator is None:
+        _remove_part(part)
+    attempt = 0
+    while True:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request_headers = dict(headers)
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            # Only resume while the remote file is unchanged, otherwise a
+            # resumed transfer would splice two different versions together.
+            if validator:
+                request_headers["If-Range"] = validator
+        try:
+            with requests.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304:
+                    return None
+                if response.status_code == 416:
+                    # Range not satisfiable: the partial file is either already
+                    # complete or stale, so check it against the remote size.
+                    total = _total_size(response, 0)
+                    if total is not None and total == offset:
+                        break
+                    _remove_part(part)
+                    continue
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    offset = 0
+                total = _total_size(response, offset)
+                response_headers = dict(response.headers)
+                # Conditional headers only apply to the first request
+                headers = {}
+                if not offset:
+                    validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                    _remove_part(part)
+                    if validator:
+                        write_metadata(part, {"validator": validator})
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if not chunk:
+                            continue
+                        f.write(chunk)
+                        offset += len(chunk)
+                        if progress is not None:
+                            progress(offset, total)
+            if total is None or offset >= total:
+                break
+            raise requests.exceptions.ChunkedEncodingError(
+                f"Connection closed after {offset:,} of {total:,} bytes"
+            )
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout):
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            time.sleep(min(2 ** attempt, 30))
+
+    os.replace(part, dest)
+    _remove_part(part)
+    return response_headers
+
+
+def _remove_part(part):
+    """Delete a partial download and its stored validator, whichever exist."""
+    for name in (part, part + META_SUFFIX):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_metadata(dest):
+    """Load the sidecar metadata written next to ``dest`` ({} if missing)."""
+    try:
+        with open(dest + META_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_metadata(dest, meta):
+    """Atomically write the sidecar metadata for ``dest``."""
+    tmp = dest + META_SUFFIX + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, dest + META_SUFFIX)
+
+
+def refresh_file(url, dest, interval=0, progress=None, validate=None, **kwargs):
+    """Make sure ``dest`` holds the current remote copy of ``url``.
+
+    The remote is only contacted when ``dest`` is missing or the last check is
+    older than ``interval`` seconds. The request is a conditional GET built
+    from the ETag / Last-Modified stored in the sidecar metadata, so an
+    unchanged remote costs a single ``304`` round trip. Servers without
+    validators are caught by the SHA-256 comparison: an identical download
+    leaves ``dest`` untouched. Returns ``True`` when ``dest`` was replaced.
+
+    ``validate(path)`` may check a changed download before it replaces
+    ``dest`` and raise if it is unusable (e.g. an HTML error page instead of
+    the file). The download is then discarded, ``dest`` keeps the last good
+    copy and the error is re-raised; the same remote is not fetched again
+    until ``interval`` has passed.
+    """
+    meta = read_metadata(dest)
+    have_file = os.path.exists(dest)
+    if have_file and meta.get("url") == url and time.time() - meta.get("checked_at", 0) < interval:
+        return False
+
+    headers = {}
+    if have_file and meta.get("url") == url:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    staging = dest + ".download"
+    response_headers = download_file(url, staging, progress=progress, headers=headers, **kwargs)
+    if response_headers is None:
+        meta["checked_at"] = time.time()
+        write_metadata(dest, meta)
+        return False
+
+    sha256 = file_sha256(staging)
+    changed = not have_file or sha256 != meta.get("sha256")
+    if changed and validate is not None:
+        try:
+            validate(staging)
+        except Exception:
+            os.remove(staging)
+            meta["checked_at"] = time.time()
+            write_metadata(dest, meta)
+            raise
+    if changed:
+        os.replace(staging, dest)
+    else:
+        os.remove(staging)
+    write_metadata(dest, {
+        "url": url,
+        "etag": response_headers.get("ETag"),
+        "last_modified": response_headers.get("Last-Modified"),
+        "size": os.path.getsize(dest),
+        "sha256": sha256,
+        "checked_at": time.time(),
+    })
+    return changed
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+import duckdb
+
+from queries import VIEW_COLUMNS, filtered_query, pivot_query, sql_literal
+
+# label -> (file extension, DuckDB COPY options, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "FORMAT csv, HEADER true", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "FORMAT csv, HEADER true, COMPRESSION gzip", "application/gzip"),
+    "Parquet (zstd)": ("parquet", "FORMAT parquet, COMPRESSION zstd", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "FORMAT xlsx, HEADER true",
+              "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+# One worksheet holds 1,048,576 rows, one of which is the header
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def load_excel(conn):
+    """Install (first time only, needs network) and load DuckDB's ``excel`` extension.
+
+    Meant to run once at startup so exports never download anything when a
+    user clicks. Returns ``False`` when the extension is unavailable, e.g.
+    offline without a cached copy.
+    """
+    try:
+        conn.execute("INSTALL excel; LOAD excel")
+    except duckdb.Error:
+        return False
+    return True
+
+
+def available_formats(rows, excel=True):
+    """Export formats that can hold ``rows`` rows (Excel only if loadable and within one sheet)."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "Excel" or (excel and rows <= EXCEL_MAX_ROWS)]
+
+
+def copy_to_bytes(conn, query, params, fmt):
+    """Run ``query`` through DuckDB ``COPY ... TO`` in export format ``fmt`` and return the file bytes.
+
+    DuckDB writes the file straight from the query, so the rows never have
+    to be materialized in pandas. Excel output needs DuckDB's ``excel``
+    extension to be installed already (see :func:`load_excel`).
+    """
+    extension, options, _ = EXPORT_FORMATS[fmt]
+    if extension == "xlsx":
+        conn.execute("LOAD excel")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"export.{extension}")
+        conn.execute(f"COPY ({query}) TO {sql_literal(path)} ({options})", params)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def export_raw(conn, filters, fmt, columns=VIEW_COLUMNS["raw"]):
+    """Filtered sales rows in export format ``fmt``."""
+    query, params = filtered_query(filters, columns)
+    return copy_to_bytes(conn, query, params, fmt)
+
+
+def export_pivot(conn, filters, fmt, granularity="day", top_n=None):
+    """Route x period pivot in export format ``fmt`` (``b""`` when nothing matches)."""
+    query, params = pivot_query(conn, filters, granularity, top_n)
+    if query is None:
+        return b""
+    return copy_to_bytes(conn, query, params, fmt)
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import shutil
+
+import duckdb
+
+from downloader import file_sha256
+from prepare import prepare_join_keys, refresh_daily_rollup
+from queries import ROLLUP_TABLE, sql_literal
+
+DELTA_READERS = {
+    ".csv": "read_csv({path}, auto_detect = true)",
+    ".parquet": "read_parquet({path})",
+}
+# A delta database copies these small tables from its base snapshot and
+# holds only the new rows of the appended ones
+REFERENCE_TABLES = ("Products", "Supervisors", "product_codes")
+APPENDED_TABLES = ("sales", ROLLUP_TABLE)
+
+logger = logging.getLogger(__name__)
+
+
+def pending_files(directory):
+    """Sales delta files (CSV / Parquet) waiting in ``directory``, oldest name first."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        entry.path for entry in os.scandir(directory)
+        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in DELTA_READERS
+    )
+
+
+def claim_files(directory, claimed):
+    """Move the files pending in ``directory`` into ``claimed`` and return every file waiting there.
+
+    A claimed file is no longer visible to other processes polling
+    ``directory``, so none of them can read it while it is applied and
+    archived. Files already in ``claimed`` were left by an ingest that did
+    not finish and are returned again; a new file with the same name waits
+    in ``directory`` until they are archived.
+    """
+    os.makedirs(claimed, exist_ok=True)
+    for path in pending_files(directory):
+        target = os.path.join(claimed, os.path.basename(path))
+        if os.path.exists(target):
+            continue
+        try:
+            os.rename(path, target)
+        except FileNotFoundError:  # claimed by another process first
+            continue
+    return pending_files(claimed)
+
+
+def create_delta_database(path, base_path):
+    """Create an empty delta database for the prepared snapshot at ``base_path``.
+
+    Ingested rows go here instead of into the multi-GB snapshot, so applying
+    a day of sales costs about a day of data. The reference tables are
+    copied so new rows get the same join keys and rollup as the base; the
+    appended tables start empty with the base's columns. Readers union the
+    appended tables with the base -- the rollup is additive, so summing over
+    both gives the same totals as one combined table.
+    """
+    with duckdb.connect(path) as conn:
+        conn.execute(f"ATTACH {sql_literal(base_path)} AS base (READ_ONLY)")
+        for table in REFERENCE_TABLES:
+            conn.execute(f"CREATE TABLE {table} AS SELECT * FROM base.{table}")
+        for table in APPENDED_TABLES:
+            conn.execute(f"CREATE TABLE {table} AS SELECT * FROM base.{table} LIMIT 0")
+        conn.execute("DETACH base")
+
+
+def ingested_digest(conn):
+    """Short hash of the delta files recorded in ``conn``; equal contents give equal digests."""
+    rows = conn.execute("SELECT name, sha256 FROM ingested_files ORDER BY ALL").fetchall()
+    return hashlib.sha256(repr(rows).encode()).hexdigest()[:12]
+
+
+def ingest_directory(conn, directory):
+    """Append new daily sales deltas from ``directory`` to the local ``sales`` table.
+
+    Each file needs the ``sales`` columns (Code, Sales_Date, Qty, Route) and is
+    matched by name, so column order does not matter. Files are applied one
+    at a time, each in its own transaction: its rows get their join key and
+    only the rollup days they touch are recomputed. A file that cannot be
+    applied (missing columns, unreadable, wrong types) is rolled back and
+    logged without holding up the others. Every applied file is recorded in
+    ``ingested_files`` by name and SHA-256, so a file is never applied
+    twice, while a new file that reuses an old name is still picked up. A
+    full snapshot download replaces these rows along with everything else.
+
+    Files are left in place. Returns ``(paths, failed, first_date,
+    last_date)``: the files now contained in the database (just ingested or
+    recorded earlier), to be handed to :func:`archive_files` once the change
+    is durable; the files that failed; and the date range of the newly
+    added rows (``None`` if nothing was new). Re-running after a crash
+    before archiving is safe.
+    """
+    files = pending_files(directory)
+    if not files:
+        return [], [], None, None
+    conn.execute("CREATE TABLE IF NOT EXISTS ingested_files (name VARCHAR, ingested_at TIMESTAMP)")
+    conn.execute("ALTER TABLE ingested_files ADD COLUMN IF NOT EXISTS sha256 VARCHAR")
+    seen = set(conn.execute("SELECT name, sha256 FROM ingested_files").fetchall())
+
+    paths, failed = [], []
+    first_date = last_date = None
+    for path in files:
+        name, sha256 = os.path.basename(path), file_sha256(path)
+        # Rows recorded before hashes were kept only know the name
+        if (name, sha256) in seen or (name, None) in seen:
+            paths.append(path)
+            continue
+        try:
+            low, high = _apply_file(conn, path, name, sha256)
+        except duckdb.Error:
+            logger.exception("Could not ingest %s", path)
+            failed.append(path)
+            continue
+        paths.append(path)
+        if low is not None:
+            first_date = low if first_date is None else min(first_date, low)
+            last_date = high if last_date is None else max(last_date, high)
+    return paths, failed, first_date, last_date
+
+
+def _apply_file(conn, path, name, sha256):
+    reader = DELTA_READERS[os.path.splitext(name)[1].lower()].format(path=sql_literal(path))
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        low, high = conn.execute(
+            f"SELECT CAST(MIN(Sales_Date) AS DATE), CAST(MAX(Sales_Date) AS DATE) FROM {reader}"
+        ).fetchone()
+        conn.execute(f"INSERT INTO sales BY NAME SELECT * FROM {reader}")
+        conn.execute("INSERT INTO ingested_files BY NAME SELECT ? AS name, ? AS sha256, "
+                     "current_timestamp AS ingested_at", [name, sha256])
+        if low is not None:
+            prepare_join_keys(conn)
+            refresh_daily_rollup(conn, low, high)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return low, high
+
+
+def archive_files(directory, paths, subdirectory="processed"):
+    """Move delta files to ``directory/subdirectory`` (``processed`` or ``failed``) without overwriting earlier ones."""
+    if not paths:
+        return
+    archive = os.path.join(directory, subdirectory)
+    os.makedirs(archive, exist_ok=True)
+    for path in paths:
+        stem, extension = os.path.splitext(os.path.basename(path))
+        target, n = os.path.join(archive, stem + extension), 1
+        while os.path.exists(target):
+            target, n = os.path.join(archive, f"{stem}-{n}{extension}"), n + 1
+        shutil.move(path, target)
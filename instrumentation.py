@@ -0,0 +1,87 @@
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger("dispatch.timing")
+
+
+class Stage(dict):
+    """Measurements of one timed stage: name, seconds and optional counters (rows, bytes, cache, ...)."""
+
+    def count(self, value, size=True):
+        """Record the row count (and with ``size``, the shallow in-memory size) of a stage's result.
+
+        Measuring a wide DataFrame costs milliseconds, so pass ``size=False``
+        on hot paths where only the row count matters. Returns ``value``.
+        """
+        if isinstance(value, (bytes, bytearray)):
+            self["bytes"] = len(value)
+        elif isinstance(value, pd.DataFrame):
+            self["rows"] = len(value)
+            if size:
+                self["bytes"] = int(value.memory_usage(index=True, deep=False).sum())
+        elif isinstance(value, pa.Table):
+            self["rows"] = value.num_rows
+            self["bytes"] = value.nbytes
+        return value
+
+
+@contextmanager
+def timed(name, **fields):
+    """Time the enclosed block and emit one JSON log line for it.
+
+    Yields a ``Stage`` the block can add counters to. The line is logged
+    even when the block raises (with ``"error"`` set), so slow failures are
+    visible too.
+    """
+    stage = Stage(stage=name, **fields)
+    start = time.perf_counter()
+    try:
+        yield stage
+    except Exception as e:
+        stage["error"] = type(e).__name__
+        raise
+    finally:
+        stage["seconds"] = round(time.perf_counter() - start, 6)
+        logger.info(json.dumps(stage, default=str))
+
+
+class Timings:
+    """Per-rerun collection of stage timings.
+
+    One instance is created for each script run; every stage timed through
+    it carries the same ``run`` id in its log line, so a slow rerun can be
+    reassembled from the logs.
+    """
+
+    def __init__(self, **fields):
+        self.fields = {"run": uuid.uuid4().hex[:8], **fields}
+        self.stages = []
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name, **fields):
+        with timed(name, **self.fields, **fields) as stage:
+            try:
+                yield stage
+            finally:
+                self.stages.append(stage)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def finish(self):
+        """Log the total time of the run, with the stage count."""
+        self.finished = True
+        logger.info(json.dumps({"stage": "rerun", **self.fields, "stages": len(self.stages),
+                                "seconds": round(self.elapsed(), 6)}, default=str))
+
+    def rows(self):
+        """The recorded stages as plain rows for display (without the shared run fields)."""
+        return [{key: value for key, value in stage.items() if key not in self.fields} for stage in self.stages]
@@ -0,0 +1,258 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Row-level sales joined with products and supervisors (Code_Key comes from prepare.py)
+SALES_QUERY = """
+    SELECT
+        s.Code,
+        s.Sales_Date,
+        s.Qty,
+        s.Route,
+        p.Description,
+        p.Cake,
+        p.Cr_Bo AS Crates_Box,
+        sup.Supervisor,
+        CASE
+            WHEN p.Cake IS NOT NULL AND p.Cake <> 0
+                THEN ROUND_EVEN(CAST(s.Qty AS DOUBLE) / CAST(p.Cake AS DOUBLE), 0)
+            ELSE NULL
+        END AS Crt_Box
+    FROM sales AS s
+    LEFT JOIN Products AS p
+        ON s.Code_Key = p.Code_Key
+    LEFT JOIN Supervisors AS sup
+        ON s.Route = sup.Route
+"""
+
+# Pre-aggregated per day / Route / Supervisor / Crates_Box, built by prepare.py
+ROLLUP_TABLE = "daily_rollup"
+
+SALES_COLUMNS = ('Code', 'Sales_Date', 'Qty', 'Route', 'Description', 'Cake', 'Crates_Box', 'Supervisor', 'Crt_Box')
+
+# Columns each view pulls from SALES_QUERY; nothing else crosses into pandas
+VIEW_COLUMNS = {
+    "raw": ('Sales_Date', 'Route', 'Crates_Box', 'Crt_Box', 'Supervisor'),
+    "export": ('Sales_Date', 'Route', 'Code', 'Description', 'Qty', 'Cake', 'Crates_Box', 'Crt_Box', 'Supervisor'),
+}
+
+# Pivot column buckets: granularity -> (date_trunc unit, strftime label)
+GRANULARITIES = {
+    "day": ("day", "%Y-%m-%d"),
+    "week": ("week", "%Y-%m-%d"),
+    "month": ("month", "%Y-%m"),
+}
+OTHER_ROUTES = "Other"
+
+# Low-cardinality strings stored as categoricals / dictionary arrays
+CATEGORICAL_COLUMNS = ('Route', 'Supervisor', 'Crates_Box')
+
+
+@dataclass(frozen=True)
+class Filters:
+    """Sidebar selections in a normalized, hashable form."""
+    start_date: date
+    end_date: date
+    supervisors: tuple
+    crates_box: tuple
+
+    @classmethod
+    def from_selection(cls, start_date, end_date, supervisors, crates_box):
+        return cls(start_date, end_date, tuple(sorted(supervisors)), tuple(sorted(crates_box)))
+
+    def overlaps(self, start_date, end_date):
+        """Whether the selected date range shares any day with ``start_date`` .. ``end_date``."""
+        return self.start_date <= end_date and self.end_date >= start_date
+
+
+def where_clause(filters):
+    """SQL predicate and parameters for ``filters``.
+
+    The date range is expressed as a half-open range on the raw
+    ``Sales_Date`` column so DuckDB can prune row groups with zone maps.
+    An empty multiselect matches nothing, as ``isin([])`` did in pandas.
+    """
+    clauses = ["Sales_Date >= ?", "Sales_Date < ?"]
+    params = [filters.start_date, filters.end_date + timedelta(days=1)]
+    for column, values in (("Supervisor", filters.supervisors), ("Crates_Box", filters.crates_box)):
+        if values:
+            clauses.append(f"{column} IN ({', '.join(['?'] * len(values))})")
+            params.extend(values)
+        else:
+            clauses.append("FALSE")
+    return " AND ".join(clauses), params
+
+
+def filter_options(conn):
+    """Date bounds and the distinct Supervisor / Crates_Box values for the sidebar."""
+    min_date, max_date = conn.execute(
+        f"SELECT MIN(Sales_Date), MAX(Sales_Date) FROM {ROLLUP_TABLE}"
+    ).fetchone()
+    supervisors = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT Supervisor FROM {ROLLUP_TABLE} WHERE Supervisor IS NOT NULL ORDER BY 1"
+    ).fetchall()]
+    crates_box = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT Crates_Box FROM {ROLLUP_TABLE} WHERE Crates_Box IS NOT NULL ORDER BY 1"
+    ).fetchall()]
+    return pd.Timestamp(min_date).date(), pd.Timestamp(max_date).date(), supervisors, crates_box
+
+
+def summary_metrics(conn, filters):
+    """Record count, Crt_Box total and distinct routes for ``filters``, from the rollup."""
+    where, params = where_clause(filters)
+    records, crt_box, routes = conn.execute(f"""
+        SELECT COALESCE(SUM(Records), 0), COALESCE(SUM(Crt_Box), 0), COUNT(DISTINCT Route)
+        FROM {ROLLUP_TABLE}
+        WHERE {where}
+    """, params).fetchone()
+    return {"records": int(records), "crt_box": float(crt_box), "routes": int(routes)}
+
+
+def fetch_arrow(result):
+    """``pyarrow.Table`` for a DuckDB result (newer DuckDB renamed ``fetch_arrow_table``)."""
+    to_arrow = getattr(result, "to_arrow_table", None) or result.fetch_arrow_table
+    return to_arrow()
+
+
+def compact_types(data):
+    """Shrink a pandas frame or Arrow table returned by :func:`load_filtered`.
+
+    Route / Supervisor / Crates_Box become categoricals (dictionary arrays in
+    Arrow), the already rounded Crt_Box becomes a nullable 32-bit integer
+    and Sales_Date is kept at day (Arrow ``date32``) or second (pandas'
+    coarsest datetime64 unit) resolution.
+    """
+    if isinstance(data, pa.Table):
+        for i, field in enumerate(data.schema):
+            column = data.column(i)
+            if field.name in CATEGORICAL_COLUMNS:
+                column = pc.dictionary_encode(column)
+            elif field.name == 'Crt_Box':
+                column = pc.cast(column, pa.int32())
+            elif field.name == 'Sales_Date':
+                column = pc.cast(column, pa.date32())
+            else:
+                continue
+            data = data.set_column(i, field.name, column)
+        return data
+    for column in CATEGORICAL_COLUMNS:
+        if column in data:
+            data[column] = data[column].astype('category')
+    if 'Crt_Box' in data:
+        data['Crt_Box'] = data['Crt_Box'].astype('Int32')
+    if 'Sales_Date' in data:
+        data['Sales_Date'] = pd.to_datetime(data['Sales_Date']).astype('datetime64[s]')
+    return data
+
+
+def memory_usage(data):
+    """Bytes held by a pandas frame or Arrow table."""
+    if isinstance(data, pa.Table):
+        return data.nbytes
+    return int(data.memory_usage(deep=True).sum())
+
+
+def filtered_query(filters, columns=VIEW_COLUMNS["raw"]):
+    """SQL and parameters selecting ``columns`` of the sales rows matching ``filters``."""
+    unknown = set(columns) - set(SALES_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown sales columns: {', '.join(sorted(unknown))}")
+    where, params = where_clause(filters)
+    return f"SELECT {', '.join(columns)} FROM ({SALES_QUERY}) WHERE {where}", params
+
+
+def load_filtered(conn, filters, columns=VIEW_COLUMNS["raw"], arrow=False):
+    """Rows matching ``filters``; only the matching rows and ``columns`` leave DuckDB.
+
+    With ``arrow=True`` the result stays a ``pyarrow.Table`` straight from
+    DuckDB, skipping the pandas conversion (Streamlit renders Arrow natively).
+    """
+    query, params = filtered_query(filters, columns)
+    result = conn.execute(query, params)
+    return compact_types(fetch_arrow(result) if arrow else result.fetchdf())
+
+
+def load_page(conn, filters, page, page_size, sort_by='Sales_Date', descending=False,
+              columns=VIEW_COLUMNS["raw"], arrow=False):
+    """One page (0-based) of the rows matching ``filters``, sorted server-side.
+
+    The remaining columns act as tie-breakers so rows keep a stable position
+    from page to page.
+    """
+    if sort_by not in columns:
+        raise ValueError(f"Cannot sort by {sort_by!r}")
+    query, params = filtered_query(filters, columns)
+    direction = "DESC" if descending else "ASC"
+    order = ", ".join([f"{sort_by} {direction}"] + [column for column in columns if column != sort_by])
+    result = conn.execute(
+        f"{query} ORDER BY {order} LIMIT ? OFFSET ?", params + [page_size, page * page_size]
+    )
+    return compact_types(fetch_arrow(result) if arrow else result.fetchdf())
+
+
+def sql_literal(value):
+    """Quote ``value`` as a SQL string literal (for places DuckDB cannot take a parameter)."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def pivot_query(conn, filters, granularity="day", top_n=None):
+    """SQL and parameters for the Route x period pivot of ``filters`` (query is None without data).
+
+    ``granularity`` buckets the columns by day, week (labelled by its Monday)
+    or month. With ``top_n`` only the ``top_n`` routes with the largest
+    Crt_Box total keep their own row and the rest are summed into an
+    ``Other`` row, which sorts last. A DuckDB PIVOT over parameterized input
+    needs its column values spelled out, so the distinct periods are fetched
+    first.
+    """
+    unit, label = GRANULARITIES[granularity]
+    where, params = where_clause(filters)
+    route, order = "Route", "Total DESC, Route"
+    if top_n:
+        route = f"CASE WHEN route_rank <= {int(top_n)} THEN Route ELSE {sql_literal(OTHER_ROUTES)} END"
+        order = f"Route = {sql_literal(OTHER_ROUTES)}, {order}"
+    source = f"""
+        WITH base AS (
+            SELECT Route, strftime(date_trunc('{unit}', Sales_Date), '{label}') AS Period, COALESCE(Crt_Box, 0) AS Crt_Box
+            FROM {ROLLUP_TABLE}
+            WHERE {where} AND Route IS NOT NULL
+        ),
+        ranked AS (
+            SELECT Route, ROW_NUMBER() OVER (ORDER BY SUM(Crt_Box) DESC, Route) AS route_rank
+            FROM base
+            GROUP BY Route
+        )
+        SELECT {route} AS Route, Period, Crt_Box
+        FROM base JOIN ranked USING (Route)
+    """
+    periods = [row[0] for row in conn.execute(f"SELECT DISTINCT Period FROM ({source}) ORDER BY 1", params).fetchall()]
+    if not periods:
+        return None, params
+    query = f"""
+        WITH filtered AS ({source}),
+        pivoted AS (
+            PIVOT filtered ON Period IN ({', '.join(sql_literal(period) for period in periods)})
+            USING SUM(Crt_Box) GROUP BY Route
+        ),
+        totals AS (SELECT Route, SUM(Crt_Box) AS Total FROM filtered GROUP BY Route)
+        SELECT pivoted.*, totals.Total
+        FROM pivoted JOIN totals USING (Route)
+        ORDER BY {order}
+    """
+    return query, params
+
+
+def route_date_pivot(conn, filters, granularity="day", top_n=None):
+    """Route x Sales_Date matrix of summed Crt_Box with a ``Total`` column.
+
+    Aggregation and pivoting run in DuckDB over the daily rollup; only the
+    pivoted result is returned, indexed by Route and sorted by ``Total``
+    descending. See :func:`pivot_query` for ``granularity`` and ``top_n``.
+    """
+    query, params = pivot_query(conn, filters, granularity, top_n)
+    if query is None:
+        return pd.DataFrame(columns=['Total'], index=pd.Index([], name='Route'))
+    return conn.execute(query, params).fetchdf().set_index('Route')
@@ -0,0 +1,103 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+
+
+def estimate_nbytes(value):
+    """Rough in-memory size of a cached value."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pa.Table):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Thread-safe LRU cache of computed results, bounded by entries and bytes.
+
+    Keys are any hashable value, typically ``(kind, db_version, filters)``.
+    Cached objects are shared between sessions and must be treated as
+    read-only by callers. With a ``disk`` cache (see ``disk_cache.DiskCache``)
+    memory misses are looked up there before computing, and computed values
+    are written through, so other processes and restarts start warm.
+
+    ``namespace()`` names the data results are computed from. It is read
+    once before a miss is looked up or computed, and the result is only
+    stored if it is unchanged afterwards: a value computed while the data
+    was swapped may belong to either version and is returned uncached.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024, disk=None, namespace=lambda: ""):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.namespace = namespace
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, calling ``compute()`` on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        # Disk reads and computing happen outside the lock so one slow query does not block other sessions
+        namespace = self.namespace()
+        value = self.disk.get(key, namespace) if self.disk is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        computed = value is None
+        if computed:
+            value = compute()
+        if self.namespace() != namespace:
+            return value
+        if computed and self.disk is not None:
+            self.disk.put(key, value, namespace)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        nbytes = estimate_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self.total_bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """Drop every entry whose key matches ``predicate`` (all entries if None)."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate is None or predicate(k)]:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
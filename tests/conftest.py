@@ -0,0 +1,25 @@
+import os
+
+import duckdb
+import pytest
+
+from database import DatabaseManager
+from downloader import write_metadata
+
+
+@pytest.fixture
+def manager(tmp_path):
+    path = str(tmp_path / "dispatch.duckdb")
+    with duckdb.connect(path) as conn:
+        conn.execute("CREATE TABLE Products AS SELECT i AS Code, 'Product ' || i AS Description, 6 AS Cake, "
+                     "CASE WHEN i % 2 = 0 THEN 'Box' ELSE 'Crates' END AS Cr_Bo FROM range(1, 5) t(i)")
+        conn.execute("CREATE TABLE Supervisors AS SELECT 'R000' || i AS Route, 'Supervisor ' || i AS Supervisor "
+                     "FROM range(0, 3) t(i)")
+        conn.execute("CREATE TABLE sales AS SELECT CAST(1 + i % 4 AS VARCHAR) AS Code, "
+                     "DATE '2024-01-01' + CAST(i % 30 AS INTEGER) AS Sales_Date, 1 + i AS Qty, "
+                     "'R000' || (i % 3) AS Route FROM range(0, 100) t(i)")
+    write_metadata(path, {"url": "http://example.invalid", "sha256": "0" * 64})
+    os.makedirs(tmp_path / "incoming")
+    manager = DatabaseManager("http://example.invalid", path, 3600, ingest_dir=str(tmp_path / "incoming"))
+    manager.open()
+    return manager
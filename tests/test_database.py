@@ -0,0 +1,57 @@
+import glob
+import os
+
+import duckdb
+import pytest
+
+import database
+from downloader import write_metadata
+
+
+def fake_download(path, sha256, create_sql):
+    """A refresh_file stand-in that replaces ``path`` with a database built by ``create_sql``."""
+    def refresh_file(url, dest, interval=0, progress=None, validate=None):
+        os.remove(dest)
+        with duckdb.connect(dest) as conn:
+            conn.execute(create_sql)
+        write_metadata(dest, {"url": url, "sha256": sha256})
+        return True
+    return refresh_file
+
+
+def test_download_that_cannot_be_prepared_is_not_retried(manager, monkeypatch):
+    served = manager.version
+    # Opens fine, but lacks the columns prepare_database needs
+    monkeypatch.setattr(database, "refresh_file",
+                        fake_download(manager.path, "1" * 64, "CREATE TABLE sales AS SELECT 1 AS Code"))
+    activations = []
+    activate = manager._activate
+    monkeypatch.setattr(manager, "_activate", lambda version: activations.append(version) or activate(version))
+
+    with pytest.raises(duckdb.Error):
+        manager.refresh()
+    manager.refresh()
+
+    assert activations == ["1" * 12]
+    assert manager.version == served
+    assert manager.connection().execute("SELECT COUNT(*) FROM sales").fetchone() == (100,)
+    assert not glob.glob(os.path.join(os.path.dirname(manager.path), "*.tmp"))
+
+
+def test_check_download_rejects_html(tmp_path):
+    page = tmp_path / "dispatch.duckdb.download"
+    page.write_text("<!DOCTYPE html><html><body>Virus scan warning</body></html>")
+
+    with pytest.raises(duckdb.Error):
+        database.DatabaseManager._check_download(str(page))
+
+
+def test_background_loop_waits_poll_interval_even_with_zero_refresh_interval(manager, monkeypatch):
+    monkeypatch.setattr(database, "refresh_file", lambda *args, **kwargs: False)
+    manager.refresh_interval = 0
+    waits = []
+    monkeypatch.setattr(manager._stop, "wait", lambda timeout: waits.append(timeout) or True)
+
+    manager._run()
+
+    assert waits == [manager.poll_interval]
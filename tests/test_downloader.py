@@ -0,0 +1,160 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+from downloader import META_SUFFIX, download_file, read_metadata, refresh_file, write_metadata
+
+DATA = os.urandom(3 * 1024 * 1024 + 123)
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves ``DATA`` with ETag and Range support; ``server.drop_after`` cuts the next response short."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", ETAG) == ETAG:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(DATA)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(DATA) - 1}/{len(DATA)}")
+        else:
+            self.send_response(200)
+        body = DATA[start:]
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.drop_after is not None:
+            self.wfile.write(body[:self.server.drop_after])
+            self.server.drop_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests = []
+    httpd.drop_after = None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_port}/dispatch.duckdb"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_resumes_after_dropped_connection(server, tmp_path):
+    httpd, url = server
+    dest = str(tmp_path / "dispatch.duckdb")
+    httpd.drop_after = 1024 * 1024
+    progress = []
+
+    headers = download_file(url, dest, chunk_size=64 * 1024, progress=lambda done, total: progress.append(done))
+
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(dest + ".part")
+    assert headers["ETag"] == ETAG
+    assert len(httpd.requests) == 2
+    assert httpd.requests[1]["Range"] == f"bytes={1024 * 1024}-"
+    assert httpd.requests[1]["If-Range"] == ETAG
+    assert progress[-1] == len(DATA)
+
+
+def test_complete_part_file_answered_with_416(server, tmp_path):
+    httpd, url = server
+    dest = str(tmp_path / "dispatch.duckdb")
+    with open(dest + ".part", "wb") as f:
+        f.write(DATA)
+    write_metadata(dest + ".part", {"validator": ETAG})
+
+    download_file(url, dest)
+
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(dest + ".part")
+    assert not os.path.exists(dest + ".part" + META_SUFFIX)
+    assert len(httpd.requests) == 1
+    assert httpd.requests[0]["If-Range"] == ETAG
+
+
+@pytest.mark.parametrize("validator", ['"v0"', None])
+def test_stale_part_file_from_earlier_run_is_not_spliced(server, tmp_path, validator):
+    httpd, url = server
+    dest = str(tmp_path / "dispatch.duckdb")
+    with open(dest + ".part", "wb") as f:
+        f.write(os.urandom(1024 * 1024))
+    if validator is not None:
+        write_metadata(dest + ".part", {"validator": validator})
+
+    download_file(url, dest)
+
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+    assert len(httpd.requests) == 1
+    if validator is None:
+        # Nothing to check the partial file against, so it is not resumed at all
+        assert "Range" not in httpd.requests[0]
+    else:
+        assert httpd.requests[0]["If-Range"] == validator
+
+
+def test_refresh_sends_conditional_get_and_handles_304(server, tmp_path):
+    httpd, url = server
+    dest = str(tmp_path / "dispatch.duckdb")
+
+    assert refresh_file(url, dest) is True
+    meta = read_metadata(dest)
+    assert meta["etag"] == ETAG
+    assert meta["sha256"] == hashlib.sha256(DATA).hexdigest()
+    mtime = os.path.getmtime(dest)
+
+    assert refresh_file(url, dest) is False
+    assert httpd.requests[-1]["If-None-Match"] == ETAG
+    assert os.path.getmtime(dest) == mtime
+    assert not os.path.exists(dest + ".download")
+    assert read_metadata(dest)["checked_at"] >= meta["checked_at"]
+
+    # Within the interval the remote is not contacted at all
+    assert refresh_file(url, dest, interval=3600) is False
+    assert len(httpd.requests) == 2
+
+
+def test_refresh_keeps_last_good_copy_when_validation_fails(server, tmp_path):
+    httpd, url = server
+    dest = str(tmp_path / "dispatch.duckdb")
+    with open(dest, "wb") as f:
+        f.write(b"good")
+    write_metadata(dest, {"url": url, "sha256": hashlib.sha256(b"good").hexdigest(), "checked_at": 0})
+
+    def reject(path):
+        raise ValueError(f"{path} is not a database")
+
+    with pytest.raises(ValueError):
+        refresh_file(url, dest, interval=3600, validate=reject)
+
+    with open(dest, "rb") as f:
+        assert f.read() == b"good"
+    assert not os.path.exists(dest + ".download")
+    # The bad file is not fetched again before the interval has passed
+    assert refresh_file(url, dest, interval=3600, validate=reject) is False
+    assert len(httpd.requests) == 1
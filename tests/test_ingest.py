@@ -0,0 +1,124 @@
+import glob
+import os
+import shutil
+
+import duckdb
+import pytest
+
+import database
+from database import DatabaseManager
+from ingest import create_delta_database, ingest_directory
+
+VALID = "Code,Sales_Date,Qty,Route\n1,2024-03-01,5,R0001\n2,2024-03-02,7,R0002\n"
+
+
+def write_delta(manager, name, content=VALID):
+    with open(os.path.join(manager.ingest_dir, name), "w") as f:
+        f.write(content)
+
+
+def listing(manager, subdirectory):
+    directory = os.path.join(manager.ingest_dir, subdirectory)
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def sales_rows(manager):
+    return manager.connection().execute("SELECT COUNT(*), SUM(Qty) FROM sales").fetchone()
+
+
+def staging_files(manager):
+    return glob.glob(os.path.join(os.path.dirname(manager.path), "*.tmp"))
+
+
+def test_ingest_directory_applies_files_one_at_a_time(manager, tmp_path):
+    delta = str(tmp_path / "delta.duckdb")
+    create_delta_database(delta, manager.snapshot_path(manager.version))
+    write_delta(manager, "a.csv")
+    write_delta(manager, "b.csv", "Code,Qty,Route\n1,5,R0001\n")
+
+    with duckdb.connect(delta) as conn:
+        paths, failed, first_date, last_date = ingest_directory(conn, manager.ingest_dir)
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone() == (2,)
+        assert conn.execute("SELECT name FROM ingested_files").fetchall() == [("a.csv",)]
+
+    assert [os.path.basename(path) for path in paths] == ["a.csv"]
+    assert [os.path.basename(path) for path in failed] == ["b.csv"]
+    assert (str(first_date), str(last_date)) == ("2024-03-01", "2024-03-02")
+
+
+def test_bad_file_is_set_aside_and_does_not_block_others(manager):
+    before = sales_rows(manager)
+    write_delta(manager, "a.csv")
+    write_delta(manager, "b.csv", "Code,Qty,Route\n1,5,R0001\n")
+
+    changed = manager.ingest()
+
+    assert [str(day) for day in changed] == ["2024-03-01", "2024-03-02"]
+    assert sales_rows(manager) == (before[0] + 2, before[1] + 12)
+    assert listing(manager, "processed") == ["a.csv"]
+    assert listing(manager, "failed") == ["b.csv"]
+    assert not staging_files(manager)
+    # Nothing is left to retry on the next poll
+    assert manager.ingest() is None
+
+
+def test_same_name_and_hash_is_archived_without_applying_again(manager):
+    write_delta(manager, "a.csv")
+    manager.ingest()
+    after_first = sales_rows(manager)
+    shutil.copy(os.path.join(manager.ingest_dir, "processed", "a.csv"), manager.ingest_dir)
+
+    assert manager.ingest() is None
+
+    assert sales_rows(manager) == after_first
+    assert listing(manager, "processed") == ["a-1.csv", "a.csv"]
+    assert not staging_files(manager)
+
+
+@pytest.mark.parametrize("fail_in", ["ingest_directory", "_swap"])
+def test_crash_before_archiving_keeps_files_pending(manager, monkeypatch, fail_in):
+    before = sales_rows(manager)
+    write_delta(manager, "a.csv")
+
+    def crash(*args, **kwargs):
+        raise OSError("crash")
+
+    with monkeypatch.context() as patch:
+        if fail_in == "_swap":
+            patch.setattr(manager, "_swap", crash)
+        else:
+            patch.setattr(database, "ingest_directory", crash)
+        with pytest.raises(OSError):
+            manager.ingest()
+
+    # Claimed, so no other process picks it up, but not archived
+    assert listing(manager, "claimed") == ["a.csv"]
+    assert listing(manager, "processed") == []
+    assert not staging_files(manager)
+    assert manager.ingest() is not None
+    # Applied exactly once, even when the crashed attempt had already written its delta
+    assert sales_rows(manager) == (before[0] + 2, before[1] + 12)
+    assert listing(manager, "processed") == ["a.csv"]
+    assert listing(manager, "claimed") == []
+
+
+def test_processes_sharing_the_directory_serve_each_others_ingests(manager):
+    days = []
+    other = DatabaseManager(manager.url, manager.path, 3600, ingest_dir=manager.ingest_dir,
+                            on_ingest=lambda first, last: days.append((str(first), str(last))))
+    other.open()
+    before = sales_rows(manager)
+
+    write_delta(manager, "a.csv")
+    manager.ingest()
+    # Nothing is pending any more, but the other process still switches to the new delta
+    assert [str(day) for day in other.ingest()] == ["2024-03-01", "2024-03-02"]
+    assert days == [("2024-03-01", "2024-03-02")]
+    assert sales_rows(other) == sales_rows(manager) == (before[0] + 2, before[1] + 12)
+
+    write_delta(other, "b.csv", "Code,Sales_Date,Qty,Route\n3,2024-03-05,1,R0001\n")
+    other.ingest()
+    manager.ingest()
+    assert sales_rows(manager) == sales_rows(other) == (before[0] + 3, before[1] + 13)
+    assert manager.data_id == other.data_id
+    assert listing(manager, "processed") == ["a.csv", "b.csv"]